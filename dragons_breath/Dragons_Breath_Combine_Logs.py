@@ -3,6 +3,7 @@
 from __future__ import print_function, division
 
 import glob
+import hashlib
 
 """This module combines all of the log files output by the bey viewer
 (found in /grp/hst/wfc3t/sasp/code) and combines them into one file,
@@ -28,62 +29,76 @@ Output
 class LogProcessor:
     """This class handles combining the log files.
 
+    Lines are written to the master log as soon as they are read, so
+    only a 16 byte digest of each unique line is kept in memory.
+
     Attributes
     ----------
-    _master_log_list: list of strings
-        List which contains all of the lines in the previous logs.
+    _seen: set of bytes
+        Set of the md5 digests of the lines already written to the
+        master log, used to skip duplicates.
 
     Methods
     -------
-    read_log(log_path)
-        Opens the log at the specified path and adds its contents to
-        the master list.
-    write_master_log(out_file)
-        Writes the contents of the _master_log_list to out_file.
+    combine_logs(log_paths, out_file)
+        Reads all of the logs in log_paths and writes their unique
+        lines to out_file.
+    read_log(log_path, out)
+        Opens the log at the specified path and writes the lines that
+        have not been seen yet to out.
     """
 
     def __init__(self):
         """"Initializes the log processor."""
-        self._master_log_list = list()
+        self._seen = set()
+
+    def combine_logs(self, log_paths, out_file):
+        """Reads all of the logs in log_paths and writes their unique
+        lines to out_file.
+
+        Parameters
+        ----------
+        log_paths : list of strings
+            The full paths of the log files.
+        out_file : string
+            The name of the file to write the master log to.
+        """
+        with open(out_file, 'w', buffering=1 << 20) as out:
+            for log_path in log_paths:
+                self.read_log(log_path, out)
 
-    def read_log(self, log_path):
+    def read_log(self, log_path, out):
         """Reads in all of the lines in a single log file at log_path
-        and adds them to the master_log_list.
+        and writes the ones that have not been seen yet to out.
 
         Parameters
         ----------
         log_path : string
             The full path of the single log file.
+        out : file object
+            The open master log.
         """
         with open(log_path, 'r') as f:
             for line in f:
-                if line not in self._master_log_list and 'None' not in line:
-                    self._master_log_list.append(line)
+                if 'None' in line:
+                    continue
 
-    def write_master_log(self, out_file):
-        """Writes the contents of the _master_log_list to out_file
+                digest = hashlib.md5(line.encode()).digest()
+                if digest in self._seen:
+                    continue
 
-            Parameters
-            ----------
-                out_file : string
-                    The name of the file to write the master log to.
-        """
-        with open(out_file, 'w') as f:
-            for line in self._master_log_list:
-                f.write(line)
+                self._seen.add(digest)
+                out.write(line)
 
 def main():
     """Main function which feeds all of the log files in the code
-    directory to the log processor and then tells it to write the
-    results to master_log.txt.
+    directory to the log processor, which writes the results to
+    master_log.txt.
     """
     lp = LogProcessor()
 
     logs = glob.glob('/grp/hst/wfc3t/sasp/code/bey_viewer*.log')
-    for log in logs:
-        lp.read_log(log)
-
-    lp.write_master_log('/grp/hst/wfc3t/sasp/code/master_log.txt')
+    lp.combine_logs(logs, '/grp/hst/wfc3t/sasp/code/master_log.txt')
 
 
 if __name__ == "__main__":
@@ -2,12 +2,11 @@
 
 from __future__ import print_function, division
 
+from collections import defaultdict
 import glob
-import math
+from multiprocessing.pool import ThreadPool
+import os
 
-from matplotlib.lines import Line2D
-import matplotlib.pyplot as plt
-import matplotlib.patches as patches
 import numpy as np
 
 from pyql.database.ql_database_interface import Master
@@ -34,9 +33,61 @@ Use
 Dependencies
 ------------
     This module depends on sqlalchemy and pyql. The user should also
-    have access to the Done_Cals.txt and Done_GOs.txt files.
+    have access to the Done_Cals.txt and Done_GOs.txt files. matplotlib
+    is only imported by the plotting methods.
 """
 
+
+def load_master_table(data_file):
+    """Reads the columns used by the graphs out of data_file.
+
+    All of the columns are parsed by numpy in a single pass. Note: the
+    data_file should have the same format as master_table.csv.
+
+    Parameters
+    ----------
+    data_file: string
+        Path to the file that contains the information for all the
+        stars.
+
+    Returns
+    -------
+    measured_x: numpy array of floats
+        Image x coordinate of the click (-1 if there was no db).
+    phys_x: numpy array of floats
+        Physical x coordinate of the star.
+    phys_y: numpy array of floats
+        Physical y coordinate of the star.
+    mag: numpy array of floats
+        Magnitude of the star.
+    """
+    measured_x, phys_x, phys_y, mag = np.loadtxt(
+        data_file, delimiter=',', usecols=(1, 5, 6, 7), ndmin=2, unpack=True)
+
+    return measured_x, phys_x, phys_y, mag
+
+
+def _get_columns(data_file):
+    """Returns the master table columns for data_file.
+
+    Parameters
+    ----------
+    data_file: string or tuple of numpy arrays
+        Either the path to a file with the same format as
+        master_table.csv or the columns already returned by
+        load_master_table.
+
+    Returns
+    -------
+    columns: tuple of numpy arrays
+        (measured_x, phys_x, phys_y, mag) as in load_master_table.
+    """
+    if isinstance(data_file, tuple):
+        return data_file
+
+    return load_master_table(data_file)
+
+
 class DragonsBreathHist:
     """This class stores all of the information needed for the
     histogram as well as providing a function to plot it.
@@ -47,17 +98,17 @@ class DragonsBreathHist:
         The minimum magnitude that should be plotted on the histogram.
     max_mag: int
         The maximum magnitude that should be plotted on the histogram.
-    mags_db: list of floats
-        List of the magnitudes of stars that caused Dragon's Breath.
-    mags_no_db: list of floats
-        List of the magnitudes of stars that did not cause Dragon's
+    mags_db: numpy array of floats
+        Array of the magnitudes of stars that caused Dragon's Breath.
+    mags_no_db: numpy array of floats
+        Array of the magnitudes of stars that did not cause Dragon's
         Breath.
 
     Methods
     -------
     _read_csv(self, data_file)
        Opens the data_file, extracts the magnitude information, and
-       adds it to the magnitude lists.
+       splits it into the magnitude arrays.
     plot_hist(self, highlight=-1)
         Creates a histogram using both the mags_db and mags_no_db data.
     """
@@ -66,35 +117,30 @@ class DragonsBreathHist:
         """Intializes the DragonsBreathHist."""
         self.min_mag = 0
         self.max_mag = 20
-        self.mags_db = list()
-        self.mags_no_db = list()
+        self.mags_db = np.array([])
+        self.mags_no_db = np.array([])
 
         self._read_csv(data_file)
 
     def _read_csv(self, data_file):
         """"Opens the data_file, extracts the magnitude information,
-        and adds it to the magnitude lists.
+        and splits it into the magnitude arrays.
 
         Note: the data_file should have the same format as the
         master_table.csv.
 
         Parameters
         ----------
-        data_file: string
+        data_file: string or tuple of numpy arrays
             Path to the file that contains the information (in
-            particular magnitudes) for all the stars.
+            particular magnitudes) for all the stars, or the columns
+            already read from it by load_master_table.
         """
-        with open(data_file, 'r') as f:
-            for line in f:
-                row = line.split(',')
-
-                measured_x = float(row[1])
-                mag = float(row[7])
+        measured_x, phys_x, phys_y, mag = _get_columns(data_file)
 
-                if measured_x == -1:
-                    self.mags_no_db.append(mag)
-                else:
-                    self.mags_db.append(mag)
+        no_db = measured_x == -1
+        self.mags_no_db = mag[no_db]
+        self.mags_db = mag[~no_db]
 
     def plot_hist(self, highlight=-1):
         """"Plots the information stord in self.mags_db and
@@ -111,6 +157,8 @@ class DragonsBreathHist:
             highlighted. Otherwise the magnitude bar equal to highlight
             will be highlighted.
         """
+        import matplotlib.pyplot as plt
+
         bins = np.arange(self.min_mag, self.max_mag + 1, 1)
 
         N, bins, no_db_patches = plt.hist(self.mags_no_db, bins,
@@ -149,6 +197,9 @@ class HeatMapData:
     num_stars: 2-D numpy array of ints
         A 2-D array which stores how many stars were at that x,y
         position.
+    _bin_cache: dict
+        Dictionary with bin sizes as keys and the (db_data, num_stars)
+        arrays binned to that size as values.
 
     Methods
     -------
@@ -158,6 +209,13 @@ class HeatMapData:
     _physical_to_image(px, py)
         Converts Jay's physical coordinates (px, py) to image
         coordinates.
+    _image_indices(phys_x, phys_y)
+        Converts arrays of physical coordinates to the array indices
+        of the heatmap grid that they fall in.
+    _accumulate(grid, im_x, im_y, weights=None)
+        Adds the weights (or a count of 1) at each index to grid.
+    _bin(grid, bin_size)
+        Sums grid into square bins of bin_size pixels.
     _plot_detector(ax, bin_size)
         Adds two rectangles that represent the detector to the figure
         associated with ax.
@@ -169,8 +227,9 @@ class HeatMapData:
         """Initializes the HeatMapData."""
         self.x_max = 2370   # Based on the size of Jay's Bey files.
         self.y_max = 2370
-        self.db_data = np.zeros((self.y_max, self.x_max))
-        self.num_stars = np.zeros((self.y_max, self.x_max))
+        self.db_data = np.zeros((self.y_max, self.x_max), dtype=np.int32)
+        self.num_stars = np.zeros((self.y_max, self.x_max), dtype=np.int32)
+        self._bin_cache = dict()
 
     def _image_to_physical(self, ix, iy):
         """Converts the image coordinates (ix, iy) to Jay's physical
@@ -218,6 +277,88 @@ class HeatMapData:
 
         return ix, iy
 
+    def _image_indices(self, phys_x, phys_y):
+        """Converts arrays of physical coordinates to the array indices
+        of the heatmap grid that they fall in.
+
+            Parameters
+            ----------
+                phys_x: numpy array of floats
+                    Physical x coordinates.
+                phys_y: numpy array of floats
+                    Physical y coordinates.
+
+            Returns
+            -------
+                im_x: numpy array of ints
+                    Image x indices of the coordinates inside the grid.
+                im_y: numpy array of ints
+                    Image y indices of the coordinates inside the grid.
+                inside: numpy array of bools
+                    Mask of which input coordinates fall inside the grid.
+        """
+        # Same transform as _physical_to_image, done in place on one
+        # array per axis to avoid a temporary for every step.
+        im_x = np.rint(phys_x)
+        im_x -= 1
+        im_x /= 3
+        im_x += 500
+
+        im_y = np.rint(phys_y)
+        im_y -= 1
+        im_y /= 3
+        im_y += 478
+
+        inside = (0 <= im_x) & (im_x < self.x_max) & \
+                 (0 <= im_y) & (im_y < self.y_max)
+
+        return (im_x[inside].astype(np.intp), im_y[inside].astype(np.intp),
+                inside)
+
+    def _accumulate(self, grid, im_x, im_y, weights=None):
+        """Adds the weights (or a count of 1) at each index to grid.
+
+        The indices are flattened so that all of the additions happen
+        in a single np.bincount call.
+
+            Parameters
+            ----------
+                grid: 2-D numpy array
+                    Either db_data or num_stars.
+                im_x: numpy array of ints
+                    Image x indices.
+                im_y: numpy array of ints
+                    Image y indices.
+                weights: numpy array or None
+                    The value to add at each index. If None, 1 is added.
+        """
+        flat = im_y * self.x_max + im_x
+        grid += np.bincount(flat, weights=weights,
+                            minlength=self.y_max * self.x_max). \
+            astype(grid.dtype, copy=False).reshape(self.y_max, self.x_max)
+
+    def _bin(self, grid, bin_size):
+        """Sums grid into square bins of bin_size pixels.
+
+        The grid itself is left untouched so the heatmap can be plotted
+        again with a different bin size.
+
+            Parameters
+            ----------
+                grid: 2-D numpy array
+                    Either db_data or num_stars.
+                bin_size: int
+                    The size of the bins for the heatmap.
+
+            Returns
+            -------
+                binned: 2-D numpy array
+                    The grid summed over each bin.
+        """
+        return grid.reshape(self.y_max // bin_size, bin_size,
+                            self.x_max // bin_size,
+                            bin_size).sum(axis=(1, 3))
+
     def _plot_detector(self, ax, bin_size):
         """Adds two rectangles that represent the detector to the
         figure associated with ax.
@@ -229,6 +370,8 @@ class HeatMapData:
             bin_size: (int, int)
                 The size of the pixel bins in the heatmap.
         """
+        import matplotlib.patches as patches
+
         lower_left_2 = [502, 502]
         lower_right_2 = [1870, 585]
         upper_left_2 = [506, 1180]
@@ -286,32 +429,30 @@ class HeatMapData:
         cax: colorbar axis object
             Colorbar axis.
         """
+        from matplotlib.lines import Line2D
+        import matplotlib.pyplot as plt
+
         fig = in_fig
         ax = in_ax
 
         # This is bin the db_data and num_stars data to the larger pixel size.
         want = (bin_size, bin_size)
-        self.db_data = self.db_data.reshape(self.y_max // want[0], want[0],
-                                            self.x_max // want[1],
-                                            want[1]).sum(3).sum(1)
-
-        self.num_stars = self.num_stars.reshape(self.y_max // want[0], want[0],
-                                                self.x_max // want[1],
-                                                want[1]).sum(3).sum(1)
+        if bin_size not in self._bin_cache:
+            self._bin_cache[bin_size] = (self._bin(self.db_data, bin_size),
+                                         self._bin(self.num_stars, bin_size))
+        db_data, num_stars = self._bin_cache[bin_size]
 
         if normalized:
             # This keeps the code from dividing by 0 (ie. if there were 0 stars
             # in that bin). If that is the case that bin is set to -1.
-            with np.errstate(divide='ignore', invalid='ignore'):
-                normalized = np.true_divide(self.db_data, self.num_stars)
-                normalized[normalized == np.inf] = -1
-                normalized[np.isnan(normalized) == True] = -1
+            normalized = np.full(db_data.shape, -1, dtype=np.float32)
+            np.divide(db_data, num_stars, out=normalized, where=num_stars != 0)
 
             cax = ax.imshow(normalized, interpolation='none', cmap='bwr',
                             vmin=-1, vmax=1)
 
         else:
-            cax = ax.imshow(self.db_data, interpolation='none', cmap='bwr',
+            cax = ax.imshow(db_data, interpolation='none', cmap='bwr',
                             vmin=-1, vmax=1)
 
         plt.gca().invert_yaxis()
@@ -354,23 +495,16 @@ class FullHeatMap(HeatMapData):
 
         This includes the physical x,y positions of all of the stars in the
         file. Note: this file should have the same format as master_table.csv.
+        The columns already read by load_master_table may be passed
+        instead of a path.
         """
-        with open(data_file, 'r') as f:
-            for line in f:
-                row = line.split(',')
+        measured_x, phys_x, phys_y, mag = _get_columns(data_file)
 
-                measured_x = float(row[1])
-                phys_x = round(float(row[5]))
-                phys_y = round(float(row[6]))
+        im_x, im_y, inside = self._image_indices(phys_x, phys_y)
+        signs = np.where(measured_x[inside] == -1, -1, 1)
 
-                im_x, im_y = self._physical_to_image(phys_x, phys_y)
-                if 0 <= im_x < self.x_max and 0 <= im_y < self.y_max:
-                    if measured_x == -1:
-                        self.db_data[im_y][im_x] -= 1
-                        self.num_stars[im_y][im_x] += 1
-                    else:
-                        self.db_data[im_y][im_x] += 1
-                        self.num_stars[im_y][im_x] += 1
+        self._accumulate(self.db_data, im_x, im_y, signs)
+        self._accumulate(self.num_stars, im_x, im_y)
 
 
 class OneMagHeatMap(HeatMapData):
@@ -387,6 +521,9 @@ class OneMagHeatMap(HeatMapData):
     -------
     _read_csv(data_file)
        Reads in the pertinent data from data_file.
+    build_all(data_file, magnitudes)
+        Creates a OneMagHeatMap for each of the magnitudes in turn while
+        only reading and binning the stars once.
     """
     def __init__(self, data_file, magnitude):
         """Initializes the OneMagHeatMap."""
@@ -400,27 +537,66 @@ class OneMagHeatMap(HeatMapData):
         In this case, it would be the physical coordinates and
         magnitude of each star. Then, only the stars that match the
         specified magnitude will be added to db_data. Note: the
-        data_file should have the same form as master_table.csv.
+        data_file should have the same form as master_table.csv. The
+        columns already read by load_master_table may be passed instead
+        of a path.
+        """
+        measured_x, phys_x, phys_y, mag = _get_columns(data_file)
+
+        im_x, im_y, inside = self._image_indices(phys_x, phys_y)
+        is_db = (measured_x[inside] != -1) & \
+                (np.floor(mag[inside]) == self._magnitude)
+
+        self._accumulate(self.db_data, im_x[is_db], im_y[is_db])
+        self._accumulate(self.num_stars, im_x, im_y)
+
+    @classmethod
+    def build_all(cls, data_file, magnitudes):
+        """Creates a OneMagHeatMap for each of the magnitudes in turn
+        while only reading and binning the stars once.
+
+        Since num_stars counts every star regardless of magnitude, it
+        is computed once and shared by all of the heatmaps. The
+        heatmaps are made one at a time as they are asked for, so only
+        the db_data of the current one needs to be kept in memory.
+
+        Parameters
+        ----------
+        data_file: string or tuple of numpy arrays
+            Path to a file with the same form as master_table.csv or
+            the columns already read from it by load_master_table.
+        magnitudes: list of ints
+            The magnitudes to create heatmaps for.
+
+        Yields
+        ------
+        magnitude: int
+            The magnitude of the heatmap.
+        heatmap: OneMagHeatMap
+            The heatmap of the stars of that magnitude.
         """
-        with open(data_file, 'r') as f:
-            for line in f:
-                row = line.split(',')
-
-                measured_x = float(row[1])
-                phys_x = round(float(row[5]))
-                phys_y = round(float(row[6]))
-                in_mag = math.floor(float(row[7]))
-
-                im_x, im_y = self._physical_to_image(phys_x, phys_y)
-                if 0 <= im_x < self.x_max and 0 <= im_y < self.y_max:
-                    if measured_x == -1:
-                        self.num_stars[im_y][im_x] += 1
-                    else:
-                        if in_mag == self._magnitude:
-                            self.db_data[im_y][im_x] += 1
-                            self.num_stars[im_y][im_x] += 1
-                        else:
-                            self.num_stars[im_y][im_x] += 1
+        measured_x, phys_x, phys_y, mag = _get_columns(data_file)
+        num_stars = None
+
+        for magnitude in magnitudes:
+            heatmap = cls.__new__(cls)
+            HeatMapData.__init__(heatmap)
+            heatmap._magnitude = magnitude
+
+            if num_stars is None:
+                im_x, im_y, inside = heatmap._image_indices(phys_x, phys_y)
+                heatmap._accumulate(heatmap.num_stars, im_x, im_y)
+                num_stars = heatmap.num_stars
+
+                measured = measured_x[inside] != -1
+                in_mag = np.floor(mag[inside])
+            else:
+                heatmap.num_stars = num_stars
+
+            is_db = measured & (in_mag == magnitude)
+            heatmap._accumulate(heatmap.db_data, im_x[is_db], im_y[is_db])
+
+            yield magnitude, heatmap
 
 
 class PieChartData:
@@ -437,10 +613,12 @@ class PieChartData:
     go_or_cal: string
         String that specifies if the pie chart is just for the GO or
         Cal proposals or both. Valid stings are 'go', 'cal', or 'all'.
-    _cal_ids: list of strings
-        List of all the Cal proposal ids that were in Don_Cals.txt.
-    _go_ids: list of strings
-        List of all the GO proposal ids that were in Don_GO.txt.
+    _cal_ids: set of strings
+        Set of all the Cal proposal ids that were in Don_Cals.txt.
+    _go_ids: set of strings
+        Set of all the GO proposal ids that were in Don_GO.txt.
+    _known_ids: set of strings
+        Union of _cal_ids and _go_ids.
     total_images: int
         Number of all the images in all of the proposals.
     num_anomalies: dict
@@ -451,11 +629,36 @@ class PieChartData:
         being how many there were in all the proposals.
     num_with_anomalies: int
         Number of images that had some kind of anomaly.
+    _anomaly_rows: list of rows
+        Rows of the Anomalies table holding the rootname and the flag
+        for every anomaly and known feature. None until first needed.
+    _looked_at: dict
+        Dictionary with ql_roots as keys and lists of (link, ql_root)
+        in the finished proposals as values.
+    _anomaly_cache: dict
+        Dictionary with (anomaly, present) as keys and the results of
+        get_one_type_anomaly as values.
+    _anomaly_counts: defaultdict of ints
+        Number of looked at images with each anomaly or known feature.
+        None until first needed.
+    _with_anomalies: set of strings
+        The ql_roots of the looked at images with any anomaly or known
+        feature.
+    _sorted_anomalies: list of strings
+        The names of the anomalies in alphabetical order.
+    _sorted_features: list of strings
+        The names of the known features in alphabetical order.
 
     Methods
     -------
     _get_id_lists()
         Reads in the proposal ids from Done_Cals.txt and Done_GOs.txt.
+    _load_anomalies()
+        Queries the Anomalies and Master tables once for every anomaly
+        and known feature.
+    _count_anomalies()
+        Counts every anomaly and known feature in a single pass over
+        the Anomalies rows.
     get_total_images()
         Gets the total number of images in all of the proposals.
     get_one_type_anomaly(anomaly, present=1)
@@ -479,6 +682,7 @@ class PieChartData:
         """Initializes the PieChartData."""
         self._go_or_cal = go_or_cal
         self._cal_ids, self._go_ids = self._get_id_lists()
+        self._known_ids = self._cal_ids | self._go_ids
 
         self.total_images = self.get_total_images()
 
@@ -504,6 +708,15 @@ class PieChartData:
                                    'satellite_trail': 0,
                                    'filter_ghost': 0}
 
+        self._anomaly_rows = None
+        self._looked_at = dict()
+        self._anomaly_cache = dict()
+        self._anomaly_counts = None
+        self._with_anomalies = set()
+
+        self._sorted_anomalies = sorted(self.num_anomalies)
+        self._sorted_features = sorted(self.num_known_features)
+
         self.get_num_anomalies()
         self.num_with_anomalies = self.get_num_images_with_anomalies()
 
@@ -516,48 +729,99 @@ class PieChartData:
 
         Returns
         -------
-        cal_list: list of strings
-            List of the finished Cal proposals.
-        go_list: list of strings
-            List of the finshed GO proposals.
+        cal_list: set of strings
+            Set of the finished Cal proposals.
+        go_list: set of strings
+            Set of the finshed GO proposals.
         """
-        cal_list = list()
-        go_list = list()
+        cal_list = set()
+        go_list = set()
 
         if self._go_or_cal == 'cal' or self._go_or_cal == 'all':
             with open('Done_Cals.txt', 'r') as f:
                 for line in f:
-                    cal_list.append(line.strip())
+                    cal_list.add(line.strip())
 
         if self._go_or_cal == 'go' or self._go_or_cal == 'all':
             with open('Done_GOs.txt', 'r') as f:
                 for line in f:
-                    go_list.append(line.strip())
+                    go_list.add(line.strip())
 
         return cal_list, go_list
 
+    def _load_anomalies(self):
+        """Queries the Anomalies and Master tables once for every
+        anomaly and known feature.
+
+        The results are stored in _anomaly_rows and _looked_at so that
+        get_one_type_anomaly does not have to go back to the database.
+        """
+        names = list(self.num_anomalies) + list(self.num_known_features)
+        columns = [getattr(Anomalies, name) for name in names]
+        self._anomaly_rows = session.query(Anomalies.rootname, *columns).all()
+
+        ql_roots = set(row.rootname[0:8] for row in self._anomaly_rows)
+        results = session.query(Master.link, Master.ql_root). \
+            filter(Master.ql_root.in_(ql_roots)).all()
+
+        self._looked_at = defaultdict(list)
+        for item in results:
+            link = item.link[-5:]
+            if link in self._known_ids:
+                self._looked_at[item.ql_root].append((link, item.ql_root))
+
+    def _count_anomalies(self):
+        """Counts every anomaly and known feature in a single pass over
+        the Anomalies rows.
+
+        The results are stored in _anomaly_counts and _with_anomalies.
+        """
+        if self._anomaly_rows is None:
+            self._load_anomalies()
+
+        names = list(self.num_anomalies) + list(self.num_known_features)
+        flagged = defaultdict(set)
+        for row in self._anomaly_rows:
+            for name in names:
+                if getattr(row, name) == 1:
+                    flagged[name].add(row.rootname[0:8])
+
+        self._anomaly_counts = defaultdict(int)
+        self._with_anomalies = set()
+        for name, rootnames in flagged.items():
+            for rootname in rootnames:
+                looked_at = self._looked_at.get(rootname, [])
+                self._anomaly_counts[name] += len(looked_at)
+                if len(looked_at) != 0:
+                    self._with_anomalies.add(rootname)
+
     def get_total_images(self):
         """Gets the total number of images in all of the proposals.
 
         Returns
         -------
-        sum(num_images) : int
-            Num_images is a list of all the numbers of images in each
-            proposal so it's sum is the total number of images.
+        total: int
+            The sum of the number of images in each proposal.
         """
-        num_images = list()
-
-        for one_id in self._cal_ids:
-            path = '/grp/hst/wfc3a/*_Links/{}/Visit*/*flt.fits'.format(one_id)
-            num = len(glob.glob(path))
-            num_images.append(num)
-
-        for one_id in self._go_ids:
-            path = '/grp/hst/wfc3a/*_Links/{}/Visit*/*flt.fits'.format(one_id)
-            num = len(glob.glob(path))
-            num_images.append(num)
-
-        return sum(num_images)
+        paths = list()
+
+        # Each *_Links directory is listed once and only the proposals
+        # that were looked at are searched for flt files.
+        for links_dir in glob.glob('/grp/hst/wfc3a/*_Links'):
+            for proposal in os.scandir(links_dir):
+                if proposal.name in self._known_ids and proposal.is_dir():
+                    paths.append(os.path.join(proposal.path, 'Visit*',
+                                              '*flt.fits'))
+
+        # The searches are waiting on the file system, so threads are
+        # enough to run them at the same time.
+        total = 0
+        with ThreadPool(16) as p:
+            for num in p.imap_unordered(lambda path: len(glob.glob(path)),
+                                        paths):
+                total += num
+
+        return total
 
     def get_one_type_anomaly(self, anomaly, present=1):
         """Gets all of the images that contain the specified anomaly.
@@ -575,19 +839,21 @@ class PieChartData:
             List of (link, rootname) for each image that contains the
             specified anomaly.
         """
-        rootnames_with_anomaly = session.query(Anomalies.rootname). \
-            filter(getattr(Anomalies, anomaly) == present).all()
-        rootnames_with_anomaly = [rootname[0][0:8] for rootname in
-                                  rootnames_with_anomaly]
+        if (anomaly, present) in self._anomaly_cache:
+            return self._anomaly_cache[(anomaly, present)]
 
-        results = session.query(Master.link, Master.ql_root). \
-            filter(Master.ql_root.in_(rootnames_with_anomaly)).all()
-        links = [item.link[-5:] for item in results]
-        rootnames = [item.ql_root for item in results]
+        if self._anomaly_rows is None:
+            self._load_anomalies()
+
+        rootnames_with_anomaly = set(row.rootname[0:8] for row in
+                                     self._anomaly_rows if
+                                     getattr(row, anomaly) == present)
+
+        looked_at_with_anomaly = list()
+        for rootname in rootnames_with_anomaly:
+            looked_at_with_anomaly.extend(self._looked_at.get(rootname, []))
 
-        looked_at_with_anomaly = [(link, rootname) for link, rootname in
-                                  zip(links, rootnames) if
-                                  link in self._cal_ids or link in self._go_ids]
+        self._anomaly_cache[(anomaly, present)] = looked_at_with_anomaly
         return looked_at_with_anomaly
 
     def get_num_anomalies(self):
@@ -599,13 +865,16 @@ class PieChartData:
         num: int
             Total number of anomalies and known features.
         """
+        if self._anomaly_counts is None:
+            self._count_anomalies()
+
         num = 0
         for anomaly in self.num_anomalies:
-            num_of_one_type = len(self.get_one_type_anomaly(anomaly))
+            num_of_one_type = self._anomaly_counts[anomaly]
             self.num_anomalies[anomaly] = num_of_one_type
             num += num_of_one_type
         for feature in self.num_known_features:
-            num_of_one_type = len(self.get_one_type_anomaly(feature))
+            num_of_one_type = self._anomaly_counts[feature]
             self.num_known_features[feature] = num_of_one_type
             num += num_of_one_type
 
@@ -620,25 +889,14 @@ class PieChartData:
 
         Returns
         -------
-        len(with_anomalies): int
-            Length of with_anomalies which is a list of all the
+        len(_with_anomalies): int
+            Length of _with_anomalies which is a set of all the
             rootnames that have an anomaly in them.
         """
-        with_anomalies = set()
-
-        for anomaly in self.num_anomalies:
-            anomalies = self.get_one_type_anomaly(anomaly)
-            if len(anomalies) != 0:
-                rootnames = set(zip(*anomalies)[1])
-                with_anomalies.update(rootnames)
-
-        for feature in self.num_known_features:
-            features = self.get_one_type_anomaly(feature)
-            if len(features) != 0:
-                rootnames = set(zip(*features)[1])
-                with_anomalies.update(rootnames)
+        if self._anomaly_counts is None:
+            self._count_anomalies()
 
-        return len(with_anomalies)
+        return len(self._with_anomalies)
 
     def make_full_pie_chart(self, start_angle=45):
         """Makes a pie chart depicting what percentage of images had
@@ -650,6 +908,8 @@ class PieChartData:
             The start angle of the pie chart (set to 45 degrees by
             default).
         """
+        import matplotlib.pyplot as plt
+
         labels = 'No Anomalies', 'Anomalies and Known Features'
 
         num_without_anomalies = self.total_images - self.num_with_anomalies
@@ -677,13 +937,16 @@ class PieChartData:
             The start angle of the pie chart (set to 220 degrees by
             default).
         """
+        import matplotlib.pyplot as plt
+
         labels = list()
         percents = list()
-        total_anomalies = self.get_num_anomalies()
+        total_anomalies = sum(self.num_anomalies.values()) + \
+            sum(self.num_known_features.values())
         adjust_anomaly_color = 0
         adjust_feature_color = 0
 
-        for anomaly in sorted(self.num_anomalies):
+        for anomaly in self._sorted_anomalies:
             if self.num_anomalies[anomaly] > 1:
                 percent = self.num_anomalies[anomaly] / total_anomalies * 100
                 percents.append(percent)
@@ -691,7 +954,7 @@ class PieChartData:
             else:
                 adjust_anomaly_color += 1
 
-        for feature in sorted(self.num_known_features):
+        for feature in self._sorted_features:
             if self.num_known_features[feature] > 1:
                 percent = self.num_known_features[
                               feature] / total_anomalies * 100
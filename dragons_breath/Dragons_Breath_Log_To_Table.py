@@ -3,8 +3,17 @@
 from __future__ import print_function, division
 
 from collections import defaultdict
+import csv
+from multiprocessing import Pool
 import os
-import glob
+
+import numpy as np
+from scipy.spatial import cKDTree
+
+try:
+    from numba import njit
+except ImportError:
+    njit = None
 
 from pyql.database.ql_database_interface import Master
 from pyql.database.ql_database_interface import session
@@ -41,9 +50,118 @@ Output
 
 Dependencies
 ------------
-    This module depends on sqlalchemy and pyql.
+    This module depends on sqlalchemy, pyql, numpy, and scipy. If numba
+    is installed it is used to compile the nearest star search.
 """
 
+
+def _nearest_star(coords, px, py, max_dist):
+    """Finds the star in coords that is closest to (px, py).
+
+    Parameters
+    ----------
+    coords: (N, 2) numpy array of floats
+        The 2mass coordinates of the stars.
+    px: float
+        Physical x coordinate.
+    py: float
+        Physical y coordinate.
+    max_dist: float
+        The squared distance a star must be within to match.
+
+    Returns
+    -------
+    index: int
+        The row of coords of the closest star, or -1 if no star was
+        within max_dist.
+    """
+    dist_squared = (coords[:, 0] - px) ** 2 + (coords[:, 1] - py) ** 2
+    index = int(np.argmin(dist_squared))
+
+    if dist_squared[index] < max_dist:
+        return index
+    return -1
+
+
+def _nearest_star_loop(coords, px, py, max_dist):
+    """Loop version of _nearest_star for numba to compile."""
+    best = max_dist
+    index = -1
+    for i in range(coords.shape[0]):
+        dx = coords[i, 0] - px
+        dy = coords[i, 1] - py
+        dist_squared = dx * dx + dy * dy
+        if dist_squared < best:
+            best = dist_squared
+            index = i
+
+    return index
+
+
+if njit is not None:
+    _nearest_star = njit(cache=True)(_nearest_star_loop)
+
+
+def _parse_2ph(name):
+    """Reads the stars out of the *_2PH.uvrd file for one rootname.
+
+    This is a module level function so that it can be run by a
+    multiprocessing Pool.
+
+    Parameters
+    ----------
+    name: string
+        The rootname of the file.
+
+    Returns
+    -------
+    name: string
+        The rootname of the file.
+    coords: (N, 2) numpy array of floats
+        The x_2mass, y_2mass coordinates of the stars.
+    mags: numpy array of strings
+        The magnitudes of the stars.
+    """
+    # The magnitudes are kept as the original strings so they are
+    # written to the table exactly as they appear in the file.
+    data = np.loadtxt(
+        '/grp/hst/wfc3t/sasp/data/completed/{}_2PH.uvrd'.format(name),
+        usecols=(0, 1, 6), dtype=str, ndmin=2)
+
+    return name, data[:, :2].astype(np.float64), data[:, 2]
+
+
+# Images with at least this many stars are searched with a KD-tree.
+_KDTREE_MIN_STARS = 1000
+
+# Offset and scale between image and Jay's physical coordinates.
+_OFFSET = np.array([500, 478], dtype=np.float64)
+_SCALE = 3.0
+
+_ROOTNAMES = None
+
+
+def _get_rootnames():
+    """Gets the rootnames of all of the *_bey.fits files in completed.
+
+    The directory is only searched the first time this is called; the
+    DictData classes all share the result.
+
+    Returns
+    -------
+    rootnames: list of strings
+        The rootnames of the completed bey files.
+    """
+    global _ROOTNAMES
+    if _ROOTNAMES is None:
+        with os.scandir('/grp/hst/wfc3t/sasp/data/completed') as entries:
+            _ROOTNAMES = [entry.name[:-len('_bey.fits')] for entry in entries
+                          if entry.name.endswith('_bey.fits') and
+                          entry.is_file(follow_symlinks=False)]
+
+    return list(_ROOTNAMES)
+
+
 class DictData:
     """This class is the superclass for all of the other data classes
     in this module.
@@ -70,9 +188,7 @@ class DictData:
 
     def __init__(self):
         """"Initializes the DictData."""
-        self.rootnames = [os.path.basename(x).replace('_bey.fits', '') for x in
-                          glob.glob(
-                              '/grp/hst/wfc3t/sasp/data/completed/*_bey.fits')]
+        self.rootnames = _get_rootnames()
 
         self.main_dict = defaultdict(list)
 
@@ -116,16 +232,22 @@ class DataBaseData(DictData):
     def add_all_database_values(self):
         """Goes through all of the rootnames and adds their respective
         filter and exposure time to the main_dict.
+
+        All of the rootnames are fetched with a single query.
         """
-        for name in self.rootnames:
-            result = session.query(UVIS_flt_0.filter, UVIS_flt_0.exptime). \
-                join(Master). \
-                filter(Master.rootname == name).all()
+        results = session.query(Master.rootname, UVIS_flt_0.filter,
+                                UVIS_flt_0.exptime). \
+            join(UVIS_flt_0). \
+            filter(Master.rootname.in_(self.rootnames)).yield_per(1000)
 
-            filt = result[0].filter
-            exptime = float(result[0].exptime)
+        for result in results:
+            # Only the first result for each rootname is kept.
+            if result.rootname in self.main_dict:
+                continue
 
-            self._add_single(name, {'filter': filt, 'exptime': exptime})
+            self._add_single(result.rootname,
+                             {'filter': result.filter,
+                              'exptime': float(result.exptime)})
 
 
 class ClickData(DictData):
@@ -133,8 +255,8 @@ class ClickData(DictData):
     master_log.txt (ie the data representing all of the mouse clicks
     for db).
 
-    It's lower level dictionary entries will be of the form:
-    {'x': float, 'y': float}.
+    Rather than a list of dictionaries per rootname, the clicks are
+    stored as numpy arrays in clicks.
 
     Attributes
     ----------
@@ -142,12 +264,15 @@ class ClickData(DictData):
         This is different from most DictData rootnames as it always
         gets all of the rootnames stored in completed even if the
         program is only being run on a subset.
+    clicks: dict
+        Dictionary with rootnames as keys and (K, 2) numpy arrays of
+        the x, y image coordinates of their clicks as values.
 
     Methods
     -------
     add_all_clicks()
         Goes through all of the lines in master_log.txt and adds the
-        x and y values of clicks to the main_dict.
+        x and y values of clicks to clicks.
     """
 
     def __init__(self):
@@ -160,20 +285,27 @@ class ClickData(DictData):
         """
         DictData.__init__(self)
 
-        self.rootnames = [os.path.basename(x).replace('_bey.fits', '') for x in
-                          glob.glob(
-                              '/grp/hst/wfc3t/sasp/data/completed/*_bey.fits')]
+        self.rootnames = _get_rootnames()
+        self.clicks = dict()
 
     def add_all_clicks(self):
         """Goes through all of the lines in master_log.txt and adds the
-        x and y values of clicks to the main_dict.
+        x and y values of clicks to clicks.
         """
-        with open('/grp/hst/wfc3t/sasp/code/master_log.txt') as f:
-            for line in f:
-                id, x, y = line.split()
-                click_dict = {'x': x, 'y': y}
+        data = np.loadtxt('/grp/hst/wfc3t/sasp/code/master_log.txt',
+                          dtype=str, ndmin=2)
+        ids = data[:, 0]
+        xy = data[:, 1:3].astype(np.float64)
+
+        # Sorting groups the clicks for each id together; the stable sort
+        # keeps them in the order they were made.
+        order = np.argsort(ids, kind='stable')
+        ids, xy = ids[order], xy[order]
 
-                self._add_single(id, click_dict)
+        unique_ids, starts = np.unique(ids, return_index=True)
+        ends = np.append(starts[1:], len(ids))
+        for id, start, end in zip(unique_ids.tolist(), starts, ends):
+            self.clicks[id] = xy[start:end]
 
 
 class AllStarsData(DictData):
@@ -181,8 +313,20 @@ class AllStarsData(DictData):
     *_2PH.uvrd files (ie the data representing all of the stars
     associated with each rootname).
 
-    It's lower level dictionary entries will be of the form:
-    {'x_2mass': float, 'y_2mass': float, 'mag': string}.
+    Rather than a list of dictionaries per rootname, the stars are
+    stored as numpy arrays in coords and mags.
+
+    Attributes
+    ----------
+    coords: dict
+        Dictionary with rootnames as keys and (N, 2) numpy arrays of
+        the x_2mass, y_2mass coordinates of their stars as values.
+    mags: dict
+        Dictionary with rootnames as keys and numpy arrays of the
+        magnitudes (as strings) of their stars as values.
+    trees: dict
+        Dictionary with rootnames as keys and a cKDTree of their coords
+        as values. Trees are only built when get_tree is called.
 
     Methods
     -------
@@ -190,31 +334,49 @@ class AllStarsData(DictData):
         Goes through all of the *_2PH.uvrd files and adds the x_2mass,
         y_2mass, and magnitude values for all of the stars associated
         with the rootnames.
+    get_tree(name)
+        Gets the cKDTree of the stars for one rootname.
     """
 
     def __init__(self):
         """Initializes the AllStarsData"""
         DictData.__init__(self)
 
+        self.coords = dict()
+        self.mags = dict()
+        self.trees = dict()
+
     def add_all_stars(self):
         """Goes through all of the *_2PH.uvrd files and adds the x_2mass,
         y_2mass, and magnitude values for all of the stars associated with the
         rootnames.
         """
-        basename = '/grp/hst/wfc3t/sasp/data/completed/'
-        for name in self.rootnames:
-            with open('{}{}_2PH.uvrd'.format(basename, name)) as f:
-                for line in f:
-                    row = line.split()
+        with Pool(8) as p:  # for linux server
+            for name, coords, mags in p.imap(_parse_2ph, self.rootnames,
+                                             chunksize=16):
+                self.coords[name] = coords
+                self.mags[name] = mags
 
-                    x_2mass = float(row[0])
-                    y_2mass = float(row[1])
-                    magnitude = row[6]
-                    star_dict = {'x_2mass': x_2mass,
-                                 'y_2mass': y_2mass,
-                                 'mag': magnitude}
+    def get_tree(self, name):
+        """Gets the cKDTree of the stars for one rootname.
+
+        The tree is built the first time it is needed and reused for
+        every later click on the same image.
+
+        Parameters
+        ----------
+        name: string
+            The rootname of the image.
+
+        Returns
+        -------
+        tree: cKDTree
+            The tree of the x_2mass, y_2mass coordinates of the stars.
+        """
+        if name not in self.trees:
+            self.trees[name] = cKDTree(self.coords[name])
 
-                    self._add_single(name, star_dict)
+        return self.trees[name]
 
 
 class DragonsBreathTable:
@@ -229,29 +391,40 @@ class DragonsBreathTable:
         Stores the information associated with the master_log.txt.
     _database_data: DataBaseData
         Stores the pertinent information that is in the database.
-    _all_data: list
-        A list which contians all of the rows of the master table. The
-        rows are simply comma separated strings with all of the info.
+    _out_file: string
+        The file the master table is written to.
+    _mismatched: list of strings
+        The rootnames of the clicks that did not match a star. These are
+        appended to mismatched.txt once the table is written.
 
     Methods
     -------
     create_table()
        Combines all of the information stored in the DictData variables
+       and writes each row to _out_file.
+    _rows()
+        Makes the rows of the table for create_table.
     find_2_mass(rootname, image_x, image_y)
         Goes through all of the stars associated with rootname to find
         one that matches where the user clicked (image_x and image_y).
+    _match_physical(rootname, physical_x, physical_y)
+        Does the search for find_2_mass once the click has been
+        converted to physical coordinates.
     image_to_physical(ix, iy)
         Converts the image coordinates (ix, iy) to Jay's physical
         coordinates.
-    write_table(filename)
-        Writes the information in _all_data to filename.
     """
 
-    def __init__(self):
+    def __init__(self, out_file):
         """ Initializes the DragonsBreathTable.
 
         This primarily involves creating all of the DictData objects and
         getting the infomation associated with them.
+
+        Parameters
+        ----------
+        out_file: string
+            The output file name.
         """
         self._star_data = AllStarsData()
         self._star_data.add_all_stars()
@@ -262,7 +435,8 @@ class DragonsBreathTable:
         self._database_data = DataBaseData()
         self._database_data.add_all_database_values()
 
-        self._all_data = list()
+        self._out_file = out_file
+        self._mismatched = list()
 
     def create_table(self):
         """Handles the combining of all the DictData.
@@ -272,43 +446,85 @@ class DragonsBreathTable:
         all the stars in the rootname and aggregates the info. If it
         was not marked as a match the x_image, y_image, x_physical,
         and y_physical are set to -1 which indicates there was no db
-        caused by that star.
+        caused by that star. Each row is written out as soon as it is
+        made, and the finished table replaces _out_file at the end.
         """
-        for rootname in self._star_data.main_dict:
-            matches = list()
-            clicks = list()
+        # The rows are written to a temporary file which only replaces
+        # _out_file once the whole table is done, so a failure partway
+        # through leaves the previous table in place.
+        tmp_file = self._out_file + '.tmp'
+        try:
+            with open(tmp_file, 'w', buffering=1 << 20, newline='') as f:
+                csv.writer(f, lineterminator='\n').writerows(self._rows())
+        except BaseException:
+            if os.path.exists(tmp_file):
+                os.remove(tmp_file)
+            raise
+
+        os.replace(tmp_file, self._out_file)
+
+        if len(self._mismatched) != 0:
+            with open('/grp/hst/wfc3t/sasp/code/mismatched.txt', 'a',
+                      buffering=1 << 16) as f:
+                f.write('\n'.join(self._mismatched) + '\n')
+            self._mismatched = list()
+
+    def _rows(self):
+        """Makes the rows of the table, one for every star in every
+        rootname.
 
-            dragons_breath_clicks = self._click_data.main_dict[rootname]
-            for click in dragons_breath_clicks:
-                click_x, click_y = float(click['x']), float(click['y'])
-                match = self.find_2_mass(rootname, click_x, click_y)
+        Yields
+        ------
+        row: tuple
+            The rootname, x_image, y_image, x_physical, y_physical,
+            x_2mass, y_2mass, magnitude, filter, and exposure time of
+            one star.
+        """
+        for rootname in self._star_data.coords:
+            # Maps the 2mass coordinates of each matched star to the
+            # click that matched it.
+            match_map = dict()
 
-                if match is not None:
-                    matches.append(match)
-                    clicks.append((click_x, click_y))
+            dragons_breath_clicks = self._click_data.clicks.get(rootname)
+            if dragons_breath_clicks is None:
+                dragons_breath_clicks = np.empty((0, 2))
 
-            for star in self._star_data.main_dict[rootname]:
-                x_2mass = star['x_2mass']
-                y_2mass = star['y_2mass']
-                magnitude = star['mag']
+            # Same transform as image_to_physical for all of the
+            # clicks at once.
+            physical_clicks = 1 + (dragons_breath_clicks - _OFFSET) * _SCALE
 
-                if (x_2mass, y_2mass) in matches:
-                    index = matches.index((x_2mass, y_2mass))
-                    x_image, y_image = clicks[index]
+            clicks = zip(dragons_breath_clicks.tolist(),
+                         physical_clicks.tolist())
+            for (click_x, click_y), (phys_x, phys_y) in clicks:
+                match = self._match_physical(rootname, phys_x, phys_y)
 
-                    x_physical, y_physical = self.image_to_physical(
-                        x_image, y_image)
+                if match is not None:
+                    # Keeps the first click that matched the star.
+                    match_map.setdefault(
+                        match, (click_x, click_y, phys_x, phys_y))
+
+            # There are no rows for an image without any stars, and it
+            # may not be in the database either.
+            if len(self._star_data.coords[rootname]) == 0:
+                continue
+
+            # The filter and exposure time are the same for every star
+            # in the image.
+            database_values = self._database_data.main_dict[rootname][0]
+            filt = database_values['filter']
+            exposure_time = database_values['exptime']
+
+            stars = zip(self._star_data.coords[rootname].tolist(),
+                        self._star_data.mags[rootname].tolist())
+            for (x_2mass, y_2mass), magnitude in stars:
+                hit = match_map.get((x_2mass, y_2mass))
+                if hit is not None:
+                    x_image, y_image, x_physical, y_physical = hit
                 else:
                     x_image = y_image = x_physical = y_physical = -1
 
-                filt = self._database_data.main_dict[rootname][0]['filter']
-                exposure_time = self._database_data.main_dict[rootname][0]['exptime']
-
-                data = (rootname, str(x_image), str(y_image), str(x_physical),
-                        str(y_physical), str(x_2mass), str(y_2mass), magnitude,
-                        filt, str(exposure_time))
-                row = ','.join(data)
-                self._all_data.append(row)
+                yield (rootname, x_image, y_image, x_physical, y_physical,
+                       x_2mass, y_2mass, magnitude, filt, exposure_time)
 
     def find_2_mass(self, rootname, image_x, image_y):
         """Goes through all of the stars associated with rootname to
@@ -335,23 +551,55 @@ class DragonsBreathTable:
         """
         physical_x, physical_y = self.image_to_physical(image_x, image_y)
 
+        return self._match_physical(rootname, physical_x, physical_y)
+
+    def _match_physical(self, rootname, physical_x, physical_y):
+        """Does the search for find_2_mass once the click has been
+        converted to physical coordinates.
+
+        Parameters
+        ----------
+        rootname: string
+            The HST id associated with the click.
+        physical_x: float
+            Physical x coordinate of click.
+        physical_y: float
+            Physical y coordinate of click.
+
+        Returns
+        -------
+        match: (float, float)
+            The 2mass coordinates of the matching star. If no match is
+            found, then None will be returned instead.
+        """
         min_dist = 100 ** 2  # Searching for stars within 100 pixels
         match = (-1, -1)
 
-        for star in self._star_data.main_dict[rootname]:
-            x_2mass = float(star['x_2mass'])
-            y_2mass = float(star['y_2mass'])
+        coords = self._star_data.coords.get(rootname)
+        if coords is not None and len(coords) >= _KDTREE_MIN_STARS:
+            tree = self._star_data.get_tree(rootname)
+            dist, index = tree.query([physical_x, physical_y], k=1,
+                                     distance_upper_bound=100)
 
-            dist_squared = (physical_x - x_2mass) ** 2 + (physical_y - y_2mass) ** 2
+            # The distance is checked again the same way as the linear
+            # search so that both agree on stars right at the edge.
+            if index < len(coords):
+                x_2mass, y_2mass = coords[index].tolist()
+                dist_squared = (x_2mass - physical_x) ** 2 + \
+                               (y_2mass - physical_y) ** 2
+                if dist_squared < min_dist:
+                    match = (x_2mass, y_2mass)
 
-            if dist_squared < min_dist:
-                min_dist = dist_squared
-                match = (x_2mass, y_2mass)
+        elif coords is not None and len(coords) != 0:
+            index = _nearest_star(coords, float(physical_x),
+                                  float(physical_y), float(min_dist))
+
+            if index != -1:
+                match = (float(coords[index, 0]), float(coords[index, 1]))
 
         if match == (-1, -1):
             print("No matching 2mass star was found!")
-            with open('/grp/hst/wfc3t/sasp/code/mismatched.txt', 'a') as f:
-                f.write(rootname + '\n')
+            self._mismatched.append(rootname)
             return None
         else:
             return match
@@ -379,26 +627,13 @@ class DragonsBreathTable:
 
         return px, py
 
-    def write_table(self, filename):
-        """ Writes all of the information in _all_data to filename.
-
-        Parameters
-        ----------
-        filename: string
-            The output file name.
-        """
-        with open(filename, 'w') as f:
-            for row in self._all_data:
-                f.write(row + '\n')
-
 
 def main():
     """Main function which runs the DragonBreathTable and currently writes the
     result to master_table.csv.
     """
-    table = DragonsBreathTable()
+    table = DragonsBreathTable('/grp/hst/wfc3t/sasp/code/master_table.csv')
     table.create_table()
-    table.write_table('/grp/hst/wfc3t/sasp/code/master_table.csv')
 
 
 if __name__ == "__main__":
@@ -6,7 +6,7 @@ from matplotlib import gridspec
 import matplotlib.pyplot as plt
 
 from Dragons_Breath_Graph_Data import OneMagHeatMap, PieChartData, \
-    DragonsBreathHist, FullHeatMap
+    DragonsBreathHist, FullHeatMap, load_master_table
 
 """This module implements the classes in Dragons_Breath_Graph_Data to
 create the plots used in Larissa's final presentation.
@@ -33,7 +33,8 @@ Dependencies
     This module depends on the Dragons_Breath_Graph_Data module.
 """
 
-def main_full_heatmap(save_file=''):
+def main_full_heatmap(save_file='',
+                      table='/grp/hst/wfc3t/sasp/code/master_table.csv'):
     """Handles creating and then labeling the full heatmap.
 
     Parameters
@@ -44,10 +45,13 @@ def main_full_heatmap(save_file=''):
         The axis object corresponding to the figure.
     save_file: string
         The path to which the heatmap should be saved.
+    table: string or tuple of numpy arrays
+        The path to master_table.csv or the columns already read from it
+        by load_master_table.
     """
     fig = plt.figure()
     ax = plt.gca()
-    fhmd = FullHeatMap('/grp/hst/wfc3t/sasp/code/master_table.csv')
+    fhmd = FullHeatMap(table)
 
     fhm_cax = fhmd.plot_heatmap(fig, ax, True, True)
     cbar = fig.colorbar(fhm_cax, ticks=[-1, 0, 1])
@@ -62,7 +66,9 @@ def main_full_heatmap(save_file=''):
         plt.savefig(save_file)
 
 
-def make_heatmap_and_hist(mag, hist, show_plot):
+def make_heatmap_and_hist(mag, hist, show_plot,
+                          table='/grp/hst/wfc3t/sasp/code/master_table.csv',
+                          mag_map=None):
     """Handles creating and then labeling the one magnitude heatmap and
     corresponding histogram.
 
@@ -77,11 +83,18 @@ def make_heatmap_and_hist(mag, hist, show_plot):
     show_plot: bool
         A boolean representing whether to the plot should be saved to
         a file of simply displayed on the screen.
+    table: string or tuple of numpy arrays
+        The path to master_table.csv or the columns already read from it
+        by load_master_table.
+    mag_map: OneMagHeatMap
+        An already built heatmap for mag. If None, it is created from
+        table.
     """
     fig = plt.figure(mag, figsize=(15, 11.25))
     gs = gridspec.GridSpec(9, 3)
 
-    mag_map = OneMagHeatMap('/grp/hst/wfc3t/sasp/code/master_table.csv', mag)
+    if mag_map is None:
+        mag_map = OneMagHeatMap(table, mag)
     plt.subplot(gs[:, :-1])
     ax_2 = plt.gca()
     mag_map.plot_heatmap(fig, ax_2, False)
@@ -102,8 +115,13 @@ def make_heatmap_and_hist(mag, hist, show_plot):
 def main():
     """Main function which calls the plotting methods for all of the
     pie charts, histograms, and heatmaps.
+
+    master_table.csv is only read once and the columns are shared by
+    all of the heatmaps and the histogram.
     """
-    main_full_heatmap()
+    table = load_master_table('/grp/hst/wfc3t/sasp/code/master_table.csv')
+
+    main_full_heatmap(table=table)
 
     pie = PieChartData('go')
     pie.make_full_pie_chart(320)
@@ -127,10 +145,12 @@ def main():
     pie.make_anomaly_pie_chart()
     plt.show()
 
-    hist = DragonsBreathHist('/grp/hst/wfc3t/sasp/code/master_table.csv')
-
-    for i in range(20):
-        make_heatmap_and_hist(i, hist, True)
+    hist = DragonsBreathHist(table)
+    # Each heatmap is plotted as soon as it is made so only one is held
+    # in memory at a time.
+    for i, mag_map in OneMagHeatMap.build_all(table, range(20)):
+        make_heatmap_and_hist(i, hist, True, table, mag_map)
+        del mag_map
 
 
 if __name__ == "__main__":
@@ -1,10 +1,11 @@
 #!/usr/bin/env python
 from __future__ import print_function, division
 
-from multiprocessing import Pool
+import logging
+from multiprocessing.pool import ThreadPool
 import os
 from shutil import copy
-import glob
+import sys
 
 from sqlalchemy import or_
 
@@ -34,6 +35,31 @@ Dependencies
 """
 
 
+log = logging.getLogger(__name__)
+
+_BASENAMES_IN_DIR = None
+
+
+def _get_basenames_in_dir():
+    """Gets the names of the flt files already in
+    /grp/hst/wfc3t/sasp/data/.
+
+    The directory is only listed the first time this is called.
+
+    Returns
+    -------
+    basenames_in_dir: set of strings
+        The file names of the flt files in the directory.
+    """
+    global _BASENAMES_IN_DIR
+    if _BASENAMES_IN_DIR is None:
+        with os.scandir('/grp/hst/wfc3t/sasp/data') as entries:
+            _BASENAMES_IN_DIR = set(entry.name for entry in entries
+                                    if entry.name.endswith('_flt.fits'))
+
+    return _BASENAMES_IN_DIR
+
+
 def copy_to_sasp(file_path):
     """This function copies the file located at file_path to
     /grp/hst/wfc3t/sasp/data/.
@@ -43,19 +69,16 @@ def copy_to_sasp(file_path):
     file_path: string
         Full path to the flt file.
     """
-    files_in_dir = glob.glob('/grp/hst/wfc3t/sasp/data/*_flt.fits')
-    basenames_in_dir = [os.path.basename(file) for file in files_in_dir]
-
-    if os.path.basename(file_path) not in basenames_in_dir:
+    if os.path.basename(file_path) not in _get_basenames_in_dir():
         try:
-            print('Copying from ' + file_path)
+            log.info('Copying from %s', file_path)
             copy(file_path, '/grp/hst/wfc3t/sasp/data/')
-            print(file_path + ' is done!')
+            log.info('%s is done!', file_path)
         except IOError:
-            print(file_path + ' does not exist!')
+            log.info('%s does not exist!', file_path)
 
     else:
-        print(file_path + ' is already in the directory.')
+        log.info('%s is already in the directory.', file_path)
 
 
 def main():
@@ -66,6 +89,8 @@ def main():
     The images that are to be included were taken with either the F606W
     or F814W filters and had an exposure time > 300 seconds.
     """
+    logging.basicConfig(stream=sys.stdout, level=logging.INFO,
+                        format='%(message)s')
 
     results = session.query(Master.dir, Master.rootname).\
         join(UVIS_flt_0).filter(UVIS_flt_0.exptime > 300).\
@@ -74,12 +99,17 @@ def main():
 
     origin_paths = ['{}_flt.fits'.format(os.path.join(item.dir, item.rootname)) for item in results]
 
-    print('Starting to copy images...')
+    log.info('Starting to copy images...')
+
+    # The destination is listed once here and shared by every thread.
+    _get_basenames_in_dir()
 
-    p = Pool(4)  # for linux server
-    p.map(copy_to_sasp, origin_paths)
+    # Copying is limited by the file system rather than the CPU, so
+    # threads are used instead of processes.
+    p = ThreadPool(32)
+    p.map(copy_to_sasp, origin_paths, chunksize=32)
 
-    print('Complete. All files copied over.')
+    log.info('Complete. All files copied over.')
 
 if __name__ == "__main__":
     main()
@@ -2,6 +2,7 @@
 
 from __future__ import print_function, division
 
+from concurrent.futures import ThreadPoolExecutor
 from datetime import datetime
 import glob
 from matplotlib import use
@@ -52,6 +53,31 @@ Dependencies
 """
 
 
+def _read_image(path):
+    """Reads the image at path and the mean used to scale it.
+
+    The file is memory mapped and only the primary HDU is loaded, so
+    the pages are read as the mean is taken rather than all at once.
+
+    Parameters
+    ----------
+    path: string
+        Full path to the bey file.
+
+    Returns
+    -------
+    image_data: 2-D numpy array
+        The image.
+    mean: float
+        The mean value of the image.
+    """
+    with fits.open(path, memmap=True, lazy_load_hdus=True) as hdul:
+        image_data = hdul[0].data
+        mean = image_data.mean(dtype=np.float32)
+
+    return image_data, mean
+
+
 class Logger:
     """This class handles writing the coordinates of offending stars to
     a log file.
@@ -60,8 +86,8 @@ class Logger:
 
     Attributes
     ----------
-    coords_list: list of strings
-        List which contains strings of the form 'id xpos ypos'
+    coords_list: list of tuples
+        List which contains tuples of the form (id, xpos, ypos)
         which represent the recorded star positions.
 
     Methods
@@ -90,8 +116,7 @@ class Logger:
         y: float
             The y position of the star.
         """
-        self.coords_list.append(
-            '{} {} {}\n'.format(identifier, str(x), str(y)))
+        self.coords_list.append((identifier, x, y))
 
     def undo(self):
         """Removes the last item in the coords_list.
@@ -108,9 +133,9 @@ class Logger:
         out_file = '/grp/hst/wfc3t/sasp/code/bey_viewer_{}_{}_{:02d}:{:02d}.log'. \
             format(now.month, now.day, now.hour, now.minute)
 
-        with open(out_file, 'w') as f:
-            for coord in self.coords_list:
-                f.write(coord)
+        with open(out_file, 'w', buffering=1 << 16) as f:
+            f.writelines('{} {} {}\n'.format(identifier, x, y) for
+                         identifier, x, y in self.coords_list)
 
 
 class BeyViewer:
@@ -132,7 +157,12 @@ class BeyViewer:
         List which contains the full paths of all of the images needing
         to be displayed.
     _fig: matplotlib figure
-        Figure object which is used to display the images.
+        Figure object which is used to display the images. It is created
+        once and reused for every image.
+    _image: matplotlib AxesImage
+        The image shown in _fig, updated in place for each new image.
+    _current_rootname: string
+        The HST identifier of the image currently being displayed.
     _log: Logger
         Logger object which is used to record mouse clicks.
     _should_run: bool
@@ -144,14 +174,25 @@ class BeyViewer:
     _question: bool
         Boolean that marks whether or not the current image should be
         put in the 'questionable' folder.
+    _executor: ThreadPoolExecutor
+        Single background thread which reads the next image while the
+        current one is being looked at.
+    _next_image: Future
+        The pending _read_image of the image that will be shown next.
 
     Methods
     -------
-    _on_click(event, rootname)
+    _on_click(event)
         Handles the mouse clicks in matplotlib.
     _on_key_press(event)
         Handles the keys pressed in matplotlib.
-    _open_image(path)
+    _on_close(event)
+        Goes on to the next image if the user closes the window.
+    _setup_figure()
+        Creates the figure and connects the event handlers.
+    _next()
+        Stops waiting on the current image so the next can be shown.
+    _open_image(path, index)
         Opens one image (path) in matplotlib.
     run()
         Loops through showing all the images.
@@ -169,28 +210,32 @@ class BeyViewer:
         self._path_list = path_list
 
         self._fig = None
+        self._image = None
+        self._current_rootname = None
         self._log = Logger()
         self._should_run = True
         self._is_bad = False
         self._question = False
 
-    def _on_click(self, event, rootname):
+        self._executor = ThreadPoolExecutor(max_workers=1)
+        self._next_image = None
+
+    def _on_click(self, event):
         """Handles the mouse clicks in matplotlib.
 
         The x and y position of the mouse click is given to the logger
-        so that they can be recorded in the log file.
+        so that they can be recorded in the log file along with the
+        rootname of the image currently being displayed.
 
         Parameters
         ----------
         event: button press event
             The button press event
-        rootname: string
-            The HST identifier for the image that was clicked.
         """
         if self._fig.canvas.manager.toolbar._active is None:
             clickx, clicky = event.xdata, event.ydata
             print('Clicked: {}, {}'.format(clickx, clicky))
-            self._log.add_coord(rootname, clickx, clicky)
+            self._log.add_coord(self._current_rootname, clickx, clicky)
 
     def _on_key_press(self, event):
         """Handles the keys pressed in matplotlib.
@@ -210,11 +255,11 @@ class BeyViewer:
             The key press event
         """
         if event.key == 'n':
-            plt.close('all')
+            self._next()
 
         if event.key == 'q':
-            plt.close('all')
             self._should_run = False
+            self._next()
 
         if event.key == 'w':
             self._log.write_out()
@@ -223,49 +268,104 @@ class BeyViewer:
             self._log.undo()
 
         if event.key == 'b':
-            plt.close('all')
             self._is_bad = True
+            self._next()
 
         if event.key == 'v':
-            plt.close('all')
             self._question = True
+            self._next()
 
-    def _open_image(self, path):
-        """Opens one image located at path in matplotlib.
-
-        The program also automatically moves the matplotlib window and
-        resizes it to look nice on Larissa's computer.
+    def _on_close(self, event):
+        """Goes on to the next image if the user closes the window, the
+        same as pressing 'n'. A new window is opened for the next image.
 
         Parameters
         ----------
-        path: string
-            Full path to the file to be displayed
+        event: close event
+            The close event
         """
-        # this is the unique HST identifier
-        rootname = os.path.basename(path).replace('_bey.fits', '')
-        print(rootname)
+        self._fig = None
+        event.canvas.stop_event_loop()
+
+    def _next(self):
+        """Stops waiting on the current image so the next can be
+        shown.
+        """
+        if self._fig is not None:
+            self._fig.canvas.stop_event_loop()
+
+    def _setup_figure(self):
+        """Creates the figure and connects the event handlers.
 
+        The window is also moved to the left monitor, resized, and made
+        the active window.
+        """
         self._fig = plt.figure()
-        self._fig.suptitle(rootname)
+        self._image = None
 
         # This is to put the image on the left monitor, adjust the size,
         # and automatically make it the active window.
         plt.get_current_fig_manager().window.setGeometry(-2550, 0, 1250, 2000)
         plt.get_current_fig_manager().window.raise_()
 
-        image_data = fits.getdata(path)
-        mean = np.mean(image_data)
+        self._fig.canvas.mpl_connect('button_press_event', self._on_click)
+        self._fig.canvas.mpl_connect('key_press_event', self._on_key_press)
+        self._fig.canvas.mpl_connect('close_event', self._on_close)
+
+        plt.show(block=False)
 
-        plt.imshow(image_data, cmap='gray', vmin=0, vmax=4 * mean)
-        plt.gca().invert_yaxis()
-        plt.tight_layout()
+    def _open_image(self, path, index):
+        """Opens one image located at path in matplotlib.
 
-        self._fig.canvas.mpl_connect('button_press_event',
-                                     lambda event: self._on_click(event,
-                                                                  rootname))
-        self._fig.canvas.mpl_connect('key_press_event', self._on_key_press)
+        The same figure is reused for every image; only the image data,
+        color scale, and title are changed. This waits until the user
+        presses a key which moves on to the next image. While the image
+        is displayed, the next image in _path_list is read in the
+        background.
+
+        Parameters
+        ----------
+        path: string
+            Full path to the file to be displayed
+        index: int
+            The position of path in _path_list.
+        """
+        # this is the unique HST identifier
+        rootname = os.path.basename(path).replace('_bey.fits', '')
+        print(rootname)
+        self._current_rootname = rootname
 
-        plt.show()
+        if self._fig is None:
+            self._setup_figure()
+        self._fig.suptitle(rootname)
+
+        if self._next_image is None:
+            self._next_image = self._executor.submit(_read_image, path)
+        image_data, mean = self._next_image.result()
+
+        if index + 1 < len(self._path_list):
+            self._next_image = self._executor.submit(
+                _read_image, self._path_list[index + 1])
+        else:
+            self._next_image = None
+
+        if self._image is not None and \
+                self._image.get_array().shape == image_data.shape:
+            self._image.set_data(image_data)
+            self._image.set_clim(0, 4 * mean)
+        else:
+            if self._image is not None:
+                self._image.remove()
+
+            ax = self._fig.gca()
+            self._image = ax.imshow(image_data, cmap='gray', vmin=0,
+                                    vmax=4 * mean)
+            if not ax.yaxis_inverted():
+                ax.invert_yaxis()
+            self._fig.tight_layout()
+
+        self._fig.canvas.draw_idle()
+        self._fig.canvas.start_event_loop(timeout=-1)
 
     def run(self):
         """Loops through showing all the images.
@@ -274,8 +374,8 @@ class BeyViewer:
         moves the image to the appropriate folder once the user is done
         with it.
         """
-        for path in self._path_list:
-            self._open_image(path)
+        for index, path in enumerate(self._path_list):
+            self._open_image(path, index)
 
             if self._should_run:
                 if self._is_bad:
@@ -293,6 +393,11 @@ class BeyViewer:
             else:
                 break
 
+        if self._fig is not None:
+            plt.close(self._fig)
+            self._fig = None
+
+        self._executor.shutdown(wait=False)
         self._log.write_out()
 
 
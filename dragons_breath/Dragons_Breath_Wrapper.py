@@ -1,9 +1,18 @@
 #!/usr/bin/env python
 
-from __future__ import print_function, division
-
+import argparse
+import asyncio
+from concurrent.futures import ThreadPoolExecutor
+import csv
+from fnmatch import fnmatch
 import glob
-from multiprocessing import Pool
+import itertools
+import logging
+import os
+import shutil
+import sqlite3
+import tempfile
+import sys
 import time
 import subprocess
 
@@ -21,16 +30,438 @@ Use
 
     >>> python Dragons_Breath_Wrapper.py
 
+    The number of images processed at once and the files to run on
+    can be changed with the -j and --glob options, e.g.
+
+    >>> python Dragons_Breath_Wrapper.py -j 8 --glob '/some/dir/*_flt.fits'
+
+    The time each flt2mass.e process took and its exit status are
+    written to flt2mass_timings.csv (or the file given with --timings),
+    with one row per image it was given.
+
+    Giving --manifest keeps the list of inputs in an SQLite file. Each
+    run adds any new flt files to it and starts only the images not yet
+    marked done, or whose flt file has changed since they were.
+
+    >>> python Dragons_Breath_Wrapper.py --manifest flt_manifest.db
+
 Output
 -------
-    The only things this module outputs are those which are created in
-    Jay Anderson's code.
+    Besides the files created in Jay Anderson's code, this module
+    writes the timings csv, and logs every image flt2mass.e did not
+    write a bey file for along with the end of what it printed and
+    anything it wrote to stderr.
 
 Dependencies
 ------------
-    The user should also have flt2mass.e file in their directory.
+    The user should also have flt2mass.e file in their directory. It
+    starts fastest when its Fortran runtime is linked in statically:
+
+    >>> gfortran -static-libgfortran -static-libgcc flt2mass.F -o flt2mass.e
 """
 
+log = logging.getLogger(__name__)
+
+# Resolve all of the shared library symbols when flt2mass.e is loaded
+# rather than lazily as it runs. flt2mass.F reads the FITS files with
+# its own Fortran I/O (not CFITSIO), so the gfortran runtime's buffers
+# are raised from their defaults to cut down on read and write calls.
+_FLT2MASS_ENV = dict(os.environ, LD_BIND_NOW='1',
+                     GFORTRAN_UNFORMATTED_BUFFER_SIZE='1048576',
+                     GFORTRAN_FORMATTED_BUFFER_SIZE='65536')
+
+_FLT2MASS = os.path.abspath('flt2mass.e')
+
+# flt2mass.e writes all of its output to its working directory, so it is
+# run in a directory in RAM and the finished files are moved over after.
+_STAGING_ROOT = '/dev/shm'
+
+# Roughly how much flt2mass.e writes per image (mostly the float32 bey
+# and geo images), and how much of that is currently set aside for the
+# batches running in staging directories.
+_STAGING_BYTES_PER_IMAGE = 100 * 2**20
+_staging_reserved = 0
+
+# Dragons_Breath_View_Bey.py reads the bey files from the data directory
+# and moves each one into one of these folders once it has been looked
+# at.
+_BEY_DIR = '/grp/hst/wfc3t/sasp/data'
+_REVIEWED_DIRS = ('completed', 'bad_data', 'questionable')
+
+# How many of the last lines flt2mass.e printed are logged when it fails
+# on an image. flt2mass.F prints its error messages to stdout.
+_OUTPUT_TAIL_LINES = 20
+
+
+def _scan(pattern):
+    """Yields the files matching pattern along with their stat results.
+
+    When only the file names have wildcards, the directory is read with
+    a single os.scandir and the stat results are the ones it cached.
+    Patterns with wildcards in the directories as well are matched with
+    glob.glob and each file is stat'ed.
+
+    Parameters
+    ----------
+    pattern: string
+        A shell style pattern for the flt files, e.g.
+        /grp/hst/wfc3t/sasp/data/*_flt.fits.
+
+    Yields
+    ------
+    path: string
+        Absolute path to the file, since flt2mass.e is not run in the
+        current directory.
+    stat: os.stat_result
+        The stat result of the file.
+    """
+    directory, name_pattern = os.path.split(os.path.abspath(pattern))
+    if any(char in directory for char in '*?['):
+        for path in glob.glob(os.path.abspath(pattern)):
+            if os.path.isfile(path):
+                yield path, os.stat(path)
+        return
+
+    for entry in os.scandir(directory):
+        if fnmatch(entry.name, name_pattern) and entry.is_file():
+            yield entry.path, entry.stat()
+
+
+def _find_inputs(pattern):
+    """Finds the flt files matching pattern that still need to be run,
+    largest first.
+
+    Parameters
+    ----------
+    pattern: string
+        A shell style pattern for the flt files, e.g.
+        /grp/hst/wfc3t/sasp/data/*_flt.fits.
+
+    Returns
+    -------
+    paths: list of strings
+        Full paths to the flt files, sorted from largest to smallest.
+    """
+    sized_paths = [(stat.st_size, path) for path, stat in _scan(pattern)
+                   if not _is_done(path, stat.st_mtime)]
+
+    # Start the largest images first so the small ones fill in at the
+    # end rather than a few large ones running on their own.
+    sized_paths.sort(reverse=True)
+
+    return [path for size, path in sized_paths]
+
+
+def build_manifest(pattern, manifest_path):
+    """Writes the flt files matching pattern to an SQLite manifest.
+
+    The manifest has one row (path, size, mtime, done) per flt file.
+    Only flt files not already in the manifest are added. The rows that
+    are already there are left as they are, and _read_manifest checks
+    them against the files on disk.
+
+    Parameters
+    ----------
+    pattern: string
+        A shell style pattern for the flt files, e.g.
+        /grp/hst/wfc3t/sasp/data/*_flt.fits.
+    manifest_path: string
+        The SQLite file to write to.
+    """
+    rows = [(path, stat.st_size, stat.st_mtime)
+            for path, stat in _scan(pattern)]
+
+    with sqlite3.connect(manifest_path) as db:
+        db.execute('CREATE TABLE IF NOT EXISTS manifest '
+                   '(path TEXT PRIMARY KEY, size INTEGER, mtime REAL, '
+                   'done INTEGER DEFAULT 0)')
+        db.executemany('INSERT OR IGNORE INTO manifest (path, size, mtime) '
+                       'VALUES (?, ?, ?)', rows)
+    db.close()
+
+
+def _read_manifest(manifest_path):
+    """Reads the flt files that still need to be run from an SQLite
+    manifest, largest first.
+
+    An image is skipped if it is marked done and its flt file has the
+    same size and mtime as when it was, or if _is_done finds an up to
+    date bey file for it. Files which no longer exist are skipped.
+
+    Parameters
+    ----------
+    manifest_path: string
+        The SQLite file written by build_manifest.
+
+    Returns
+    -------
+    paths: list of strings
+        Full paths to the flt files, sorted from largest to smallest.
+    """
+    db = sqlite3.connect(manifest_path)
+    rows = db.execute(
+        'SELECT path, size, mtime, done FROM manifest').fetchall()
+    db.close()
+
+    sized_paths = []
+    for path, size, mtime, done in rows:
+        try:
+            stat = os.stat(path)
+        except OSError:
+            continue
+
+        if done and (stat.st_size, stat.st_mtime) == (size, mtime):
+            continue
+        if _is_done(path, stat.st_mtime):
+            continue
+        sized_paths.append((stat.st_size, path))
+
+    sized_paths.sort(reverse=True)
+
+    return [path for size, path in sized_paths]
+
+
+def _mark_done(db, file_paths):
+    """Marks file_paths as done in an open SQLite manifest.
+
+    The size and mtime of each flt file are updated along with it, so a
+    file changed after it was run is not taken as done.
+
+    Parameters
+    ----------
+    db: sqlite3 Connection
+        The open manifest.
+    file_paths: list of strings
+        Full paths to the flt files which were finished.
+    """
+    rows = []
+    for path in file_paths:
+        stat = os.stat(path)
+        rows.append((stat.st_size, stat.st_mtime, path))
+
+    with db:
+        db.executemany('UPDATE manifest SET size = ?, mtime = ?, done = 1 '
+                       'WHERE path = ?', rows)
+
+
+def _is_done(file_path, flt_mtime):
+    """Checks whether flt2mass has already been run on an image.
+
+    flt2mass.e writes its <rootname>_bey.fits output to the current
+    directory, and the bey viewer later moves it from the data directory
+    into its completed, bad_data or questionable folders. The image
+    counts as done if the bey file is in any of those places and is
+    newer than the flt file.
+
+    Parameters
+    ----------
+    file_path: string
+        Full path to the flt file.
+    flt_mtime: float
+        The modification time of the flt file.
+
+    Returns
+    -------
+    done: bool
+        Whether the bey file is up to date.
+    """
+    bey_name = '{}_bey.fits'.format(os.path.basename(file_path)[:9])
+    for base in (os.getcwd(), _BEY_DIR):
+        for directory in (base,) + tuple(os.path.join(base, reviewed)
+                                         for reviewed in _REVIEWED_DIRS):
+            try:
+                bey_mtime = os.stat(os.path.join(directory,
+                                                 bey_name)).st_mtime
+            except OSError:
+                continue
+
+            if bey_mtime >= flt_mtime:
+                return True
+
+    return False
+
+
+def _prefetch(file_path):
+    """Asks the operating system to start reading file_path into the
+    page cache so it is ready by the time flt2mass.e opens it.
+
+    Parameters
+    ----------
+    file_path: string
+        Full path to the flt file.
+    """
+    if not hasattr(os, 'posix_fadvise'):
+        return
+
+    try:
+        fd = os.open(file_path, os.O_RDONLY)
+    except OSError:
+        return
+
+    try:
+        os.posix_fadvise(fd, 0, 0, os.POSIX_FADV_WILLNEED)
+    finally:
+        os.close(fd)
+
+
+def _finished(directory, file_paths):
+    """Finds which images in a batch flt2mass.e got all the way
+    through.
+
+    flt2mass.e writes <rootname>_bey.fits as the last step for each
+    image, so an image finished if that file is in directory and newer
+    than its flt file, as in _is_done. (Only images without such a bey
+    file are run, and the file system's timestamps can lag behind
+    time.time(), so the flt file is compared against rather than the
+    time the batch started.) The exit status cannot be used for this,
+    since flt2mass.F stops with a bare STOP (which exits with status 0)
+    when it fails on an image.
+
+    Parameters
+    ----------
+    directory: string
+        The directory flt2mass.e was run in.
+    file_paths: list of strings
+        Full paths to the flt files of the batch.
+
+    Returns
+    -------
+    finished: list of strings
+        The paths in file_paths which have a new bey file.
+    """
+    finished = []
+    for path in file_paths:
+        bey_file = os.path.join(
+            directory, '{}_bey.fits'.format(os.path.basename(path)[:9]))
+        try:
+            if os.stat(bey_file).st_mtime >= os.stat(path).st_mtime:
+                finished.append(path)
+        except OSError:
+            pass
+
+    return finished
+
+
+def _make_staging_dir(num_images):
+    """Makes a new directory under _STAGING_ROOT for one run of
+    flt2mass.e to write to.
+
+    A staging directory is only made if the outputs of num_images
+    images, on top of those of the runs already staged, fit in the free
+    space of _STAGING_ROOT. Otherwise the run writes straight to the
+    current directory, so the staging space stays bounded however many
+    runs there are at once.
+
+    Parameters
+    ----------
+    num_images: int
+        The number of images flt2mass.e will be run on.
+
+    Returns
+    -------
+    staging_dir: string
+        The path of the new directory, or None if flt2mass.e should
+        write straight to the current directory.
+    """
+    global _staging_reserved
+    if not os.path.isdir(_STAGING_ROOT):
+        return None
+
+    needed = num_images * _STAGING_BYTES_PER_IMAGE
+    stat = os.statvfs(_STAGING_ROOT)
+    if _staging_reserved + needed > stat.f_bavail * stat.f_frsize:
+        return None
+
+    staging_dir = tempfile.mkdtemp(prefix='flt2mass_', dir=_STAGING_ROOT)
+    _staging_reserved += needed
+
+    return staging_dir
+
+
+def _remove_staging_dir(staging_dir, num_images):
+    """Deletes staging_dir along with anything left in it and gives
+    back the space set aside for it.
+
+    Parameters
+    ----------
+    staging_dir: string
+        The directory made by _make_staging_dir, or None.
+    num_images: int
+        The number of images it was made for.
+    """
+    global _staging_reserved
+    if staging_dir is None:
+        return
+
+    shutil.rmtree(staging_dir, ignore_errors=True)
+    _staging_reserved -= num_images * _STAGING_BYTES_PER_IMAGE
+
+
+def _collect_outputs(staging_dir, out_dir):
+    """Moves the files flt2mass.e wrote into staging_dir to out_dir.
+
+    Each file is moved whole once it is finished, so out_dir sees one
+    sequential write per file instead of the many small ones flt2mass.e
+    makes.
+
+    Parameters
+    ----------
+    staging_dir: string
+        The directory flt2mass.e was run in, or None if it was run in
+        out_dir.
+    out_dir: string
+        The directory the outputs belong in.
+    """
+    if staging_dir is None:
+        return
+
+    for entry in os.scandir(staging_dir):
+        shutil.move(entry.path, os.path.join(out_dir, entry.name))
+
+
+def _report(file_paths, returncode, stdout, stderr, finished):
+    """Logs a flt2mass.e run that failed on any of its images or wrote
+    to stderr.
+
+    flt2mass.F prints why it failed to stdout and then exits with
+    status 0, so an image counts as failed if it has no new bey file
+    whatever the exit status, and the end of what was printed is logged
+    along with it.
+
+    Parameters
+    ----------
+    file_paths: list of strings
+        Full paths to the flt files given to flt2mass.e.
+    returncode: int
+        The exit status of flt2mass.e.
+    stdout: bytes
+        What flt2mass.e wrote to stdout.
+    stderr: bytes
+        What flt2mass.e wrote to stderr.
+    finished: list of strings
+        The paths in file_paths that flt2mass.e got all the way through.
+    """
+    rootnames = ', '.join(os.path.basename(path)[:9] for path in file_paths)
+    stderr = stderr.decode(errors='replace').strip()
+    finished = set(finished)
+    unfinished = [path for path in file_paths if path not in finished]
+
+    if returncode != 0:
+        log.error('flt2mass.e exited with status %d on %s', returncode,
+                  rootnames)
+    for path in unfinished:
+        log.warning('flt2mass.e did not write a bey file for %s',
+                    os.path.basename(path)[:9])
+    if returncode != 0 or unfinished:
+        lines = stdout.decode(errors='replace').strip().splitlines()
+        if lines:
+            log.warning('\n'.join(lines[-_OUTPUT_TAIL_LINES:]))
+
+    if stderr:
+        if returncode == 0 and not unfinished:
+            log.warning('flt2mass.e wrote to stderr on %s', rootnames)
+        log.warning(stderr)
+
 
 def flt2mass_one_image(file_path):
     """This function simply runs the flt2mass code on one image
@@ -43,24 +474,440 @@ def flt2mass_one_image(file_path):
         dragon's breath. (This is the first part of the flt file
         names).
 
+    Returns
+    -------
+    returncode: int
+        The exit status of flt2mass.e.
+    finished: list of strings
+        [file_path] if flt2mass.e wrote a new bey file for it, otherwise
+        an empty list.
     """
-    subprocess.call('./flt2mass.e {}'.format(file_path), shell=True)
+    # Run the binary directly rather than through a shell so only one
+    # process is created per image. What it prints is captured rather
+    # than interleaved on the terminal, and only logged if it fails.
+    args = [_FLT2MASS, os.path.abspath(file_path)]
+    staging_dir = _make_staging_dir(1)
+    try:
+        proc = subprocess.run(args, check=False, stdout=subprocess.PIPE,
+                              stderr=subprocess.PIPE, env=_FLT2MASS_ENV,
+                              cwd=staging_dir)
+        finished = _finished(staging_dir or os.getcwd(), [file_path])
+        _report([file_path], proc.returncode, proc.stdout, proc.stderr,
+                finished)
+        _collect_outputs(staging_dir, os.getcwd())
+    finally:
+        _remove_staging_dir(staging_dir, 1)
+
+    return proc.returncode, finished
 
 
-def main():
-    """Main function which runs the flt2mass_one_image function on
-    multiple images in parallel.
+def _pin(pid, cpu):
+    """Pins the process pid to one CPU so the scheduler does not move
+    it between cores.
 
-    Currently, this runs on all of the images in the data directory.
+    Parameters
+    ----------
+    pid: int
+        The process ID.
+    cpu: int
+        The CPU to run it on, or None to leave it unpinned.
     """
+    if cpu is None:
+        return
+
+    try:
+        os.sched_setaffinity(pid, {cpu})
+    except ProcessLookupError:
+        # It already finished.
+        pass
+
+
+async def _flt2mass_async(file_paths, cpu=None):
+    """Runs one flt2mass.e process on every image in file_paths from
+    the event loop.
+
+    flt2mass.e loops over all of its arguments, so a batch of images
+    costs one process start rather than one per image.
+
+    Parameters
+    ----------
+    file_paths: list of strings
+        Full paths to the flt files.
+    cpu: int
+        The CPU to pin flt2mass.e to, or None to leave it unpinned.
+
+    Returns
+    -------
+    returncode: int
+        The exit status of flt2mass.e.
+    seconds: float
+        How long flt2mass.e ran for.
+    finished: list of strings
+        The paths in file_paths that flt2mass.e got all the way through.
+        If flt2mass.e stops partway through a batch, the images after
+        the one it stopped on are not run and are not in this list.
+    """
+    staging_dir = _make_staging_dir(len(file_paths))
+    try:
+        begin = time.perf_counter()
+        proc = await asyncio.create_subprocess_exec(
+            _FLT2MASS, *file_paths, stdout=asyncio.subprocess.PIPE,
+            stderr=asyncio.subprocess.PIPE, env=_FLT2MASS_ENV,
+            cwd=staging_dir)
+        _pin(proc.pid, cpu)
+        try:
+            stdout, stderr = await proc.communicate()
+        except BaseException:
+            # The run was cancelled, so stop flt2mass.e before its
+            # staging directory is removed from under it.
+            if proc.returncode is None:
+                proc.kill()
+                await proc.wait()
+            raise
+        seconds = time.perf_counter() - begin
+
+        finished = _finished(staging_dir or os.getcwd(), file_paths)
+        _report(file_paths, proc.returncode, stdout, stderr, finished)
+
+        # Moving the outputs copies them when the staging directory is
+        # on a different filesystem, so keep that off of the event loop.
+        loop = asyncio.get_running_loop()
+        moving = loop.run_in_executor(None, _collect_outputs, staging_dir,
+                                      os.getcwd())
+        try:
+            await asyncio.shield(moving)
+        except asyncio.CancelledError:
+            # Let the thread finish moving the outputs before the
+            # staging directory is removed.
+            await moving
+            raise
+    finally:
+        _remove_staging_dir(staging_dir, len(file_paths))
+
+    return proc.returncode, seconds, finished
+
+
+def _add_timings(timings, batch_id, file_paths, seconds, returncode,
+                 finished):
+    """Adds a row to timings for every image in one flt2mass.e run.
+
+    Parameters
+    ----------
+    timings: list of tuples
+        The list to add (path, batch id, batch size, batch seconds,
+        returncode, finished) rows to.
+    batch_id: int
+        Number identifying the flt2mass.e run.
+    file_paths: list of strings
+        Full paths to the flt files given to flt2mass.e.
+    seconds: float
+        How long the whole flt2mass.e run took (not each image).
+    returncode: int
+        The exit status of flt2mass.e.
+    finished: list of strings
+        The paths in file_paths that flt2mass.e got all the way through,
+        as found by _finished.
+    """
+    finished = set(finished)
+    timings.extend((path, batch_id, len(file_paths), seconds, returncode,
+                    int(path in finished))
+                   for path in file_paths)
+
+
+async def _worker(paths, starts, batch, prefetcher, lookahead, on_done,
+                  timings, batch_ids, cpu):
+    """Runs the flt2mass code on one batch of images at a time until
+    there are no more to run.
+
+    Each time a batch is started, as many images lookahead places
+    further along in paths are prefetched, so about lookahead images
+    are prefetched ahead of the ones running.
+
+    Parameters
+    ----------
+    paths: list of strings
+        Full paths to the flt files, shared by all of the workers.
+    starts: iterator of ints
+        The positions in paths of the batches that have not been
+        started yet, shared by all of the workers.
+    batch: int
+        The number of images given to each flt2mass.e process.
+    prefetcher: ThreadPoolExecutor
+        The thread which runs _prefetch.
+    lookahead: int
+        How many images ahead of the current batch to prefetch.
+    on_done: function
+        Called with the paths of the images in each batch that
+        flt2mass.e finished, or None.
+    timings: list of tuples
+        List shared by all of the workers which rows are added to by
+        _add_timings for each flt2mass.e run.
+    batch_ids: iterator of ints
+        Numbers identifying each flt2mass.e run, shared by all of the
+        workers.
+    cpu: int
+        The CPU this worker's flt2mass.e processes are pinned to, or
+        None to leave them unpinned.
+    """
+    for start in starts:
+        for path in paths[start + lookahead:start + lookahead + batch]:
+            prefetcher.submit(_prefetch, path)
+
+        file_paths = paths[start:start + batch]
+        returncode, seconds, finished = await _flt2mass_async(file_paths, cpu)
+        _add_timings(timings, next(batch_ids), file_paths, seconds,
+                     returncode, finished)
+        if on_done is not None and finished:
+            on_done(finished)
+
+        # flt2mass.e stops at the first image it fails on, so the rest
+        # of the batch is run again one image at a time.
+        if len(file_paths) > 1 and len(finished) < len(file_paths):
+            finished = set(finished)
+            for path in file_paths:
+                if path in finished:
+                    continue
+
+                returncode, seconds, done = await _flt2mass_async([path], cpu)
+                _add_timings(timings, next(batch_ids), [path], seconds,
+                             returncode, done)
+                if on_done is not None and done:
+                    on_done(done)
+
+
+async def _run_all(paths, n=20, batch=1, on_done=None):
+    """Runs the flt2mass code on all of the images in paths, with at
+    most n flt2mass.e processes running at once, each given batch
+    images. The images are started in the order they appear in paths.
+
+    Only n workers are created, which share paths and take the index of
+    the next batch from one iterator, rather than one task per image.
+    The next 2 * n images (not batches, so larger batches do not
+    prefetch more than the page cache can hold) are read into the page
+    cache in the background while the current ones run. If there are
+    fewer than n batches, only one worker per batch is created.
+
+    Where the platform allows it, each worker's flt2mass.e processes are
+    pinned to their own CPU (wrapping around if n is more than the
+    number of CPUs) to keep their caches warm.
+
+    A worker which raises is logged and stops, while the others carry
+    on with the rest of the batches, so the timings of every batch that
+    was run are still returned.
+
+    Parameters
+    ----------
+    paths: list of strings
+        Full paths to the flt files.
+    n: int
+        The maximum number of flt2mass.e processes running at once.
+    batch: int
+        The number of images given to each flt2mass.e process.
+    on_done: function
+        Called with the paths of the images in each batch that
+        flt2mass.e finished, or None.
+
+    Returns
+    -------
+    timings: list of tuples
+        (path, batch id, batch size, batch seconds, returncode,
+        finished) for every image in every flt2mass.e run.
+    """
+    batch_starts = range(0, len(paths), batch)
+    n = min(n, len(batch_starts))
+    starts = iter(batch_starts)
+    lookahead = 2 * n
+    timings = []
+    batch_ids = itertools.count()
+
+    if hasattr(os, 'sched_setaffinity'):
+        cpus = sorted(os.sched_getaffinity(0))
+        worker_cpus = [cpus[i % len(cpus)] for i in range(n)]
+    else:
+        worker_cpus = [None] * n
+
+    prefetcher = ThreadPoolExecutor(max_workers=1)
+    for path in paths[:lookahead]:
+        prefetcher.submit(_prefetch, path)
+
+    try:
+        results = await asyncio.gather(
+            *[_worker(paths, starts, batch, prefetcher, lookahead, on_done,
+                      timings, batch_ids, cpu)
+              for cpu in worker_cpus],
+            return_exceptions=True)
+    finally:
+        prefetcher.shutdown(wait=False)
+
+    for result in results:
+        if isinstance(result, BaseException):
+            log.error('A flt2mass.e worker stopped early',
+                      exc_info=(type(result), result, result.__traceback__))
+
+    return timings
+
+
+def _run(paths, n=20, batch=1, on_done=None):
+    """Runs the flt2mass code on all of the images in paths.
+
+    A single image is run directly, without starting an event loop or
+    the prefetch thread. Otherwise this runs _run_all.
+
+    Parameters
+    ----------
+    paths: list of strings
+        Full paths to the flt files.
+    n: int
+        The maximum number of flt2mass.e processes running at once.
+    batch: int
+        The number of images given to each flt2mass.e process.
+    on_done: function
+        Called with the paths of the images in each batch that
+        flt2mass.e finished, or None.
+
+    Returns
+    -------
+    timings: list of tuples
+        (path, batch id, batch size, batch seconds, returncode,
+        finished) for every image in every flt2mass.e run.
+    """
+    if len(paths) <= 1:
+        timings = []
+        for batch_id, path in enumerate(paths):
+            begin = time.perf_counter()
+            returncode, finished = flt2mass_one_image(path)
+            _add_timings(timings, batch_id, [path],
+                         time.perf_counter() - begin, returncode, finished)
+            if finished and on_done is not None:
+                on_done(finished)
+        return timings
+
+    return asyncio.run(_run_all(paths, n, batch, on_done))
+
+
+def _write_timings(timings, out_file):
+    """Writes the time taken by every flt2mass.e run to a csv file.
+
+    There is one row per image. batch_seconds is how long the whole
+    run the image was part of took, and finished is 1 if flt2mass.e
+    wrote a new bey file for that image. This does not follow from
+    returncode, since flt2mass.F exits with status 0 when it fails on
+    an image, and a failed batch can still finish some images.
+
+    Parameters
+    ----------
+    timings: list of tuples
+        (path, batch id, batch size, batch seconds, returncode,
+        finished) for every image in every flt2mass.e run.
+    out_file: string
+        The name of the csv file.
+    """
+    with open(out_file, 'w', newline='') as f:
+        writer = csv.writer(f, lineterminator='\n')
+        writer.writerow(('path', 'batch_id', 'batch_size', 'batch_seconds',
+                         'returncode', 'finished'))
+        writer.writerows(timings)
+
+
+def _positive_int(value):
+    """Converts a command line value to an int greater than zero.
+
+    Parameters
+    ----------
+    value: string
+        The value given on the command line.
+
+    Returns
+    -------
+    number: int
+        The value as an int.
+    """
+    try:
+        number = int(value)
+    except ValueError:
+        number = 0
+
+    if number < 1:
+        raise argparse.ArgumentTypeError(
+            '{} is not a positive integer'.format(value))
+
+    return number
+
+
+def _parse_args(argv=None):
+    """Parses the command line options.
+
+    Parameters
+    ----------
+    argv: list of strings
+        The command line arguments. sys.argv is used if this is None.
+
+    Returns
+    -------
+    args: argparse Namespace
+        The parsed options, j (the number of flt2mass.e processes run
+        at once), batch (the number of images given to each one),
+        glob (the pattern matching the flt files), timings (the csv
+        file for the time taken per image) and manifest (the SQLite
+        manifest of flt files, or None).
+    """
+    parser = argparse.ArgumentParser(
+        description="Run flt2mass.e on many images in parallel.")
+    parser.add_argument('-j', type=_positive_int, default=os.cpu_count() or 1,
+                        help='number of flt2mass.e processes to run at once')
+    parser.add_argument('-b', '--batch', type=_positive_int, default=1,
+                        help='number of images given to each flt2mass.e '
+                             'process')
+    parser.add_argument('--glob',
+                        default='/grp/hst/wfc3t/sasp/data/*_flt.fits',
+                        help='shell style pattern matching the flt files to '
+                             'process')
+    parser.add_argument('--timings', default='flt2mass_timings.csv',
+                        help='csv file to write the time taken and exit '
+                             'status of each flt2mass.e run to')
+    parser.add_argument('--manifest', default=None,
+                        help='SQLite file listing the flt files to process, '
+                             'which new files matching --glob are added to')
+    return parser.parse_args(argv)
+
+
+def main(argv=None):
+    """Main function which runs the flt2mass code on multiple images in
+    parallel.
+
+    By default, this runs on all of the images in the data directory
+    which do not already have an up to date bey file, with one
+    flt2mass.e process per CPU running at once, each given one image.
+    The flt2mass.e processes are started and waited on from a single
+    event loop, so no Python worker processes are needed to watch them.
+
+    Parameters
+    ----------
+    argv: list of strings
+        The command line arguments. sys.argv is used if this is None.
+    """
+    args = _parse_args(argv)
+    logging.basicConfig(stream=sys.stdout, level=logging.INFO,
+                        format='%(message)s')
+
+    begin = time.perf_counter()
+    if args.manifest is None:
+        paths = _find_inputs(args.glob)
+        timings = _run(paths, args.j, args.batch)
+    else:
+        build_manifest(args.glob, args.manifest)
+        paths = _read_manifest(args.manifest)
 
-    begin = time.time()
-    p = Pool(20)  # for linux server
-    paths = glob.glob('/grp/hst/wfc3t/sasp/data/*_flt.fits')
+        db = sqlite3.connect(args.manifest)
+        try:
+            timings = _run(paths, args.j, args.batch,
+                           lambda done: _mark_done(db, done))
+        finally:
+            db.close()
 
-    p.map(flt2mass_one_image, paths)
+    _write_timings(timings, args.timings)
 
-    end = time.time()
+    end = time.perf_counter()
     print(end-begin)
 
 if __name__ == "__main__":
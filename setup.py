@@ -8,5 +8,6 @@ setup(name = 'dragons_breath',
       author = 'Larissa Markwardt, Matthew Bourque, Space Telescope Science Institute',
       url = 'https://grit.stsci.edu/bourque/dragons_breath.git',
       packages = find_packages(),
-      install_requires = ['matplotlib', 'numpy', 'sqlalchemy', 'astropy']
+      install_requires = ['matplotlib', 'numpy', 'sqlalchemy', 'astropy', 'scipy'],
+      extras_require = {'perf': ['numba']}
     )
\ No newline at end of file